@@ -1,6 +1,7 @@
 r"""
 ``cotk._utils`` is a function lib for internal use.
 """
+import numpy as np
 
 def trim_before_target(lists, target):
 	'''Trim the list before the target. If there is no target,
@@ -16,3 +17,16 @@ def trim_before_target(lists, target):
 	except ValueError:
 		pass
 	return lists
+
+def lengths_from_jagged(jagged):
+	'''Return the lengths of all rows of a 2-d jagged or padded array.
+
+	Arguments:
+		jagged (list or :class:`numpy.ndarray`)
+
+	Returns:
+		(:class:`numpy.ndarray`) a 1-d array of int64.
+	'''
+	if isinstance(jagged, np.ndarray) and jagged.ndim == 2:
+		return np.full(jagged.shape[0], jagged.shape[1], dtype=np.int64)
+	return np.fromiter(map(len, jagged), dtype=np.int64, count=len(jagged))
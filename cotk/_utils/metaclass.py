@@ -108,6 +108,8 @@ class DocStringInheritor(type):
 
 class LoadClassInterface:
 	r"""The support of dynamic class load."""
+	__slots__ = ()
+
 	@classmethod
 	def get_all_subclasses(cls):
 		'''Return a generator of all subclasses.
@@ -9,20 +9,53 @@ import numpy as np
 
 class UnorderedSha256:
 	'''
-		Using SHA256 on unordered elements
+		Using SHA256 on unordered elements.
+		The digests of elements are combined by bytewise addition modulo 256,
+		which is commutative, so the order of elements does not matter.
 	'''
+	# Number of pending digests folded into the result at once.
+	BATCH_SIZE = 256
+
 	def __init__(self):
-		self.result = np.array([0] * 32, dtype=np.uint8)
+		self.result = np.zeros(32, dtype=np.uint8)
+		self._pending = []
 
 	def update_data(self, data):
 		'''update digest by data. type(data)=bytes'''
-		digest = hashlib.sha256(data).digest()
-		self.update_hash(digest)
+		self._pending.append(hashlib.sha256(data).digest())
+		if len(self._pending) >= self.BATCH_SIZE:
+			self._flush()
+
+	def update_data_many(self, datas):
+		'''update digest by every element of datas. type(datas)=iterable of bytes-like objects'''
+		sha256 = hashlib.sha256
+		self._pending.extend([sha256(data).digest() for data in datas])
+		if len(self._pending) >= self.BATCH_SIZE:
+			self._flush()
+
+	def update_data_chunks(self, chunks):
+		'''update digest by the concatenation of chunks without copying them.
+		type(chunks)=iterable of bytes-like objects'''
+		sha256 = hashlib.sha256()
+		for chunk in chunks:
+			sha256.update(chunk)
+		self.update_hash(sha256.digest())
 
 	def update_hash(self, hashvalue):
 		'''update digest by hash. type(hashvalue)=bytes'''
-		self.result += np.array(list(hashvalue), dtype=np.uint8)
+		self._pending.append(bytes(hashvalue))
+		if len(self._pending) >= self.BATCH_SIZE:
+			self._flush()
+
+	def _flush(self):
+		'''fold all pending digests into the result.'''
+		if not self._pending:
+			return
+		digests = np.frombuffer(b''.join(self._pending), dtype=np.uint8).reshape(-1, 32)
+		self.result += np.add.reduce(digests, axis=0, dtype=np.uint8)
+		self._pending = []
 
 	def digest(self):
 		'''return unordered hashvalue'''
-		return bytes(self.result.tolist()).hex()
+		self._flush()
+		return self.result.tobytes().hex()
@@ -0,0 +1,108 @@
+r"""
+``cotk.metric._kernels`` provides vectorized routines on batches of sentences,
+which are shared by metrics. A batch of sentences (a 2-d jagged or padded array of int)
+is stored in CSR layout: ``flat`` contains all the tokens and ``offsets`` contains
+the start position of every sentence in ``flat`` (with the total length appended).
+"""
+from itertools import chain
+
+import numpy as np
+
+from .._utils import lengths_from_jagged
+
+# suffix of the key where :class:`.MetricChain` stores the CSR layout of a batch
+CSR_KEY_SUFFIX = "__csr"
+
+# padded batches with fewer tokens are trimmed faster sentence by sentence,
+# because of the fixed cost of the numpy calls
+MIN_PADDED_SIZE = 512
+
+def flatten_jagged(jagged):
+	r'''Convert a batch of sentences into CSR layout.
+
+	Arguments:
+		jagged (list or :class:`numpy.ndarray`): A 2-d jagged or padded array of int.
+			Size: ``[batch_size, ~sentence_length]``.
+
+	Returns:
+		(tuple): ``(flat, offsets)``, where ``flat`` is a 1-d :class:`numpy.ndarray` of int64
+		and ``offsets`` is a 1-d :class:`numpy.ndarray` of int64 with ``batch_size + 1`` elements.
+	'''
+	lengths = lengths_from_jagged(jagged)
+	offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+	np.cumsum(lengths, out=offsets[1:])
+	if isinstance(jagged, np.ndarray) and jagged.ndim == 2:
+		flat = np.ascontiguousarray(jagged, dtype=np.int64).reshape(-1)
+	else:
+		flat = np.fromiter(chain.from_iterable(jagged), dtype=np.int64, count=offsets[-1])
+	return flat, offsets
+
+def trim_eos(flat, offsets, eos_id, pad_id, start=0):
+	r'''Trim every sentence of a batch in CSR layout like :meth:`.LanguageProcessingBase.trim`.
+	The first ``start`` tokens of every sentence are dropped before trimming.
+
+	Arguments:
+		flat (:class:`numpy.ndarray`): tokens of the batch in CSR layout.
+		offsets (:class:`numpy.ndarray`): offsets of the batch in CSR layout.
+		eos_id (int): the end token. Every sentence is cut before its first end token.
+		pad_id (int): the padding token. Paddings at the end of sentences are removed.
+		start (int): number of tokens dropped at the beginning of every sentence. Default: ``0``.
+
+	Returns:
+		(tuple): ``(starts, lengths)``, 1-d :class:`numpy.ndarray` of int64 referring to
+		the start positions in ``flat`` and the lengths of the trimmed sentences.
+	'''
+	lengths = np.diff(offsets)
+	starts = offsets[:-1] + np.minimum(lengths, start)
+	row = np.repeat(np.arange(len(lengths)), lengths)
+	pos = np.arange(len(flat), dtype=np.int64) - starts[row]
+	valid = pos >= 0
+
+	# cut before the first end token
+	cut = offsets[1:] - starts
+	eos_index = np.flatnonzero(valid & (flat == eos_id))
+	eos_row = row[eos_index]
+	first = np.ones(len(eos_index), dtype=bool)
+	np.not_equal(eos_row[1:], eos_row[:-1], out=first[1:])
+	cut[eos_row[first]] = pos[eos_index[first]]
+
+	# remove paddings before the cut position
+	keep = np.flatnonzero(valid & (flat != pad_id) & (pos < cut[row]))
+	keep_row = row[keep]
+	last = np.ones(len(keep), dtype=bool)
+	np.not_equal(keep_row[1:], keep_row[:-1], out=last[:-1])
+	trimmed = np.zeros(len(lengths), dtype=np.int64)
+	trimmed[keep_row[last]] = pos[keep[last]] + 1
+	return starts, trimmed
+
+def split_csr(flat, starts, lengths):
+	r'''Convert sentences in ``flat`` back to a list of list of int.
+
+	Arguments:
+		flat (:class:`numpy.ndarray`): tokens of the batch in CSR layout.
+		starts (:class:`numpy.ndarray`): start positions of the sentences.
+		lengths (:class:`numpy.ndarray`): lengths of the sentences.
+
+	Returns:
+		(list): A list of sentences, each of which is a list of int.
+	'''
+	tokens = flat.tolist()
+	return [tokens[begin:begin + length] for begin, length in zip(starts.tolist(), lengths.tolist())]
+
+def trim_batch(jagged, eos_id, pad_id, start=0, csr=None):
+	r'''Trim a batch of sentences with :func:`trim_eos`.
+
+	Arguments:
+		jagged (list or :class:`numpy.ndarray`): A 2-d jagged or padded array of int.
+		eos_id (int): the end token.
+		pad_id (int): the padding token.
+		start (int): number of tokens dropped at the beginning of every sentence. Default: ``0``.
+		csr (tuple): ``(flat, offsets)`` of ``jagged`` returned by :func:`flatten_jagged`,
+			if it has been computed. Default: ``None``.
+
+	Returns:
+		(list): A list of trimmed sentences, each of which is a list of int.
+	'''
+	flat, offsets = flatten_jagged(jagged) if csr is None else csr
+	starts, lengths = trim_eos(flat, offsets, eos_id, pad_id, start)
+	return split_csr(flat, starts, lengths)
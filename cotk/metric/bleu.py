@@ -9,6 +9,7 @@ import numpy as np
 import tqdm
 from nltk.translate.bleu_score import corpus_bleu, sentence_bleu, SmoothingFunction
 from .metric import MetricBase
+from . import _kernels
 from .._utils import hooks
 
 
@@ -32,6 +33,32 @@ def _replace_unk(_input, _unk_id, _target=-1):
 		output.append(_output)
 	return output
 
+def _trim_batch(dataloader, data, key, start=0):
+	r'''Auxiliary function for trimming a batch of sentences:
+
+	Arguments:
+		dataloader (:class:`.dataloader.LanguageProcessingBase`): the dataloader used for trimming.
+		data (dict): the data passed to ``forward``.
+		key (str): the key of the batch in ``data``.
+		start (int): number of tokens dropped before trimming every sentence.
+
+	Returns:
+
+		* list: trimmed sentences. Padded arrays with at least ``_kernels.MIN_PADDED_SIZE``
+		  tokens are trimmed at once by :mod:`._kernels`, reusing the CSR layout provided
+		  by :class:`.MetricChain` if there is one. Tokens of padded arrays are python int
+		  in both ways, so their hash values do not depend on the size of the batch.
+	'''
+	batch = data[key]
+	csr = data.get(key + _kernels.CSR_KEY_SUFFIX)
+	if csr is None and not (isinstance(batch, np.ndarray) and batch.ndim == 2 \
+			and batch.size >= _kernels.MIN_PADDED_SIZE):
+		if isinstance(batch, np.ndarray):
+			# the repr of numpy integers differs from int since numpy 2.0
+			batch = batch.tolist()
+		return [list(dataloader.trim(sent[start:])) for sent in batch]
+	return _kernels.trim_batch(batch, dataloader.eos_id, dataloader.pad_id, start, csr=csr)
+
 def _sentence_bleu(ele):
 	'''Auxiliary function for computing sentence bleu:
 
@@ -88,6 +115,9 @@ class BleuCorpusMetric(MetricBase):
 		self.refs = []
 		self.hyps = []
 
+	def _csr_keys(self):
+		return [self.gen_key, self.reference_allvocabs_key]
+
 	def forward(self, data):
 		'''Processing a batch of data.
 
@@ -118,12 +148,9 @@ class BleuCorpusMetric(MetricBase):
 		if len(resp) != len(gen):
 			raise ValueError("Batch num is not matched.")
 
-		relevant_data = []
-		for gen_sen, resp_sen in zip(gen, resp):
-			self.hyps.append(self.dataloader.trim(gen_sen))
-			reference = list(self.dataloader.trim(resp_sen[1:]))
-			relevant_data.append(reference)
-			self.refs.append([reference])
+		self.hyps.extend(_trim_batch(self.dataloader, data, self.gen_key))
+		relevant_data = _trim_batch(self.dataloader, data, self.reference_allvocabs_key, start=1)
+		self.refs.extend([reference] for reference in relevant_data)
 		self._hash_relevant_data(relevant_data)
 
 	@hooks.hook_metric_close
@@ -205,6 +232,9 @@ class SelfBleuCorpusMetric(MetricBase):
 		else:
 			self.cpu_count = multiprocessing.cpu_count()
 
+	def _csr_keys(self):
+		return [self.gen_key]
+
 	def forward(self, data):
 		'''Processing a batch of data.
 
@@ -227,8 +257,7 @@ class SelfBleuCorpusMetric(MetricBase):
 		if not isinstance(gen, (np.ndarray, list)):
 			raise TypeError("Unknown type for gen.")
 
-		for gen_sen in gen:
-			self.hyps.append(self.dataloader.trim(gen_sen))
+		self.hyps.extend(_trim_batch(self.dataloader, data, self.gen_key))
 
 	@hooks.hook_metric_close
 	def close(self):
@@ -341,6 +370,9 @@ class FwBwBleuCorpusMetric(MetricBase):
 		self.refs = []
 		self.hyps = []
 
+	def _csr_keys(self):
+		return [self.gen_key]
+
 	def forward(self, data):
 		'''Processing a batch of data.
 
@@ -362,8 +394,7 @@ class FwBwBleuCorpusMetric(MetricBase):
 		if not isinstance(gen, (np.ndarray, list)):
 			raise TypeError("Unknown type for gen.")
 
-		for gen_sen in gen:
-			self.hyps.append(list(self.dataloader.trim(gen_sen)))
+		self.hyps.extend(_trim_batch(self.dataloader, data, self.gen_key))
 
 	@hooks.hook_metric_close
 	def close(self):
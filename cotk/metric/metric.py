@@ -2,8 +2,83 @@ r"""
 ``cotk.metrics`` provides classes and functions evaluating results of models.
 It provides a fair metric for every model.
 """
+import struct
+import hashlib
+from functools import lru_cache
+
+import numpy as np
+
 from .._utils.unordered_hash import UnorderedSha256
 from .._utils.metaclass import LoadClassInterface, DocStringInheritor
+from .._utils.imports import DummyObject
+from . import _kernels
+try:
+	import torch
+except ImportError as err:
+	torch = DummyObject(err)
+	torch.Tensor = DummyObject(err)
+
+# dtype string and number of dimensions of a hashed array
+_ARRAY_HEADER = struct.Struct('<16sH')
+
+# small items are often hashed many times, e.g. labels, seeds and settings
+_SMALL_ITEM_MAX_LEN = 64
+
+@lru_cache(maxsize=4096, typed=True)
+def _small_item_digest(item):
+	r'''Return the cached SHA256 digest of ``repr(item)`` for an int or a short str.'''
+	return hashlib.sha256(repr(item).encode()).digest()
+
+def _canonical_chunks(item):
+	r'''Return the chunks of bytes representing ``item``, which are hashed
+	by :meth:`MetricBase._hash_relevant_data` as if they were concatenated.
+
+	A :class:`numpy.ndarray` or :class:`torch.Tensor` with a fixed-size dtype is represented by
+	a small header (dtype and shape) followed by a view of its raw buffer,
+	which avoids building a (possibly truncated) ``repr`` and copying the data.
+	Floats are hashed by their bits, with all NaNs mapped to the same NaN.
+	Other items are represented by ``repr(item)``, so the hash values of lists,
+	ints and strings are not changed.
+
+	Arguments:
+		item: an item of relevant data.
+	'''
+	if isinstance(item, torch.Tensor):
+		try:
+			tensor = item.detach().cpu()
+			if hasattr(tensor, 'resolve_conj'): # lazy conjugate and negative views since torch 1.10
+				tensor = tensor.resolve_conj().resolve_neg()
+			item = tensor.numpy()
+		except (TypeError, RuntimeError, NotImplementedError): # e.g. bfloat16 or meta tensors
+			return (repr(item).encode(), )
+	if isinstance(item, np.ndarray) and not item.dtype.hasobject:
+		if item.dtype.kind == 'f':
+			# NaNs with different bit patterns are hashed as the same NaN
+			nan_mask = np.isnan(item)
+			if nan_mask.any():
+				item = np.where(nan_mask, np.array(np.nan, dtype=item.dtype), item)
+		header = b'\0' + _ARRAY_HEADER.pack(item.dtype.str.encode(), item.ndim) + \
+			np.array(item.shape, dtype='<i8').tobytes()
+		buffer = np.ascontiguousarray(item).reshape(-1).view(np.uint8)
+		return (header, memoryview(buffer))
+	return (repr(item).encode(), )
+
+# templates of the documents of arguments shared by several keys
+_ARRAY_TYPES = "list or :class:`numpy.ndarray`"
+_ARRAY_TYPES_WITH_TORCH = "list or :class:`numpy.ndarray` or :class:`torch.Tensor`"
+_FORWARD_ALLVOCABS_TEMPLATE = \
+				r"""* **data[{key}]** ({types}):
+				  A 2-d jagged or padded array of int. Reference sentences with
+				  :ref:`allvocabs <vocab_ref>` in index form.
+				  Contains start token (eg: ``<go>``) and end token (eg: ``<eos>``).
+				  Size: ``[batch_size, ~ref_sentence_length]``,
+				  where "~" means different sizes in this dimension is allowed."""
+_FORWARD_MULTI_TURN_ALLVOCABS_TEMPLATE = \
+				r"""* **data[multi_turn_reference_allvocabs_key]** ({types}):
+				  A 3-d jagged or padded array of int. Multi-turn reference sentences with
+				  :ref:`all vocabs <vocab_ref>`. Contains start token (eg: ``<go>``) and
+				  end token (eg: ``<eos>``). Size: ``[batch_size, ~turn_length, ~sentence_length]``,
+				  where "~" means different sizes in this dimension is allowed."""
 
 class MetricBase(LoadClassInterface, metaclass=DocStringInheritor):
 	'''Base class for metrics.
@@ -14,22 +89,14 @@ class MetricBase(LoadClassInterface, metaclass=DocStringInheritor):
 	REFERENCE_ALLVOCABS_KEY_ARGUMENTS = \
 		r"""reference_allvocabs_key (str):
 			The key of reference sentences. Default: ``ref_allvocabs``."""
-	FORWARD_REFERENCE_ALLVOCABS_ARGUMENTS = \
-				r"""* **data[reference_allvocabs_key]** (list or :class:`numpy.ndarray`):
-				  A 2-d jagged or padded array of int. Reference sentences with
-				  :ref:`allvocabs <vocab_ref>` in index form.
-				  Contains start token (eg: ``<go>``) and end token (eg: ``<eos>``).
-				  Size: ``[batch_size, ~ref_sentence_length]``,
-				  where "~" means different sizes in this dimension is allowed."""
-	FORWARD_REFERENCE_ALLVOCABS_ARGUMENTS_WITH_TORCH = \
-		FORWARD_REFERENCE_ALLVOCABS_ARGUMENTS.replace("list or :class:`numpy.ndarray`", \
-			"list or :class:`numpy.ndarray` or :class:`torch.Tensor`")
-	FORWARD_POST_ALLVOCABS_ARGUMENTS = \
-		FORWARD_REFERENCE_ALLVOCABS_ARGUMENTS.replace("reference_allvocabs_key", \
-			"post_allvocabs_key")
-	FORWARD_RESP_ALLVOCABS_ARGUMENTS = \
-		FORWARD_REFERENCE_ALLVOCABS_ARGUMENTS.replace("reference_allvocabs_key", \
-			"resp_allvocabs_key")
+	FORWARD_REFERENCE_ALLVOCABS_ARGUMENTS = _FORWARD_ALLVOCABS_TEMPLATE.format( \
+		key="reference_allvocabs_key", types=_ARRAY_TYPES)
+	FORWARD_REFERENCE_ALLVOCABS_ARGUMENTS_WITH_TORCH = _FORWARD_ALLVOCABS_TEMPLATE.format( \
+		key="reference_allvocabs_key", types=_ARRAY_TYPES_WITH_TORCH)
+	FORWARD_POST_ALLVOCABS_ARGUMENTS = _FORWARD_ALLVOCABS_TEMPLATE.format( \
+		key="post_allvocabs_key", types=_ARRAY_TYPES)
+	FORWARD_RESP_ALLVOCABS_ARGUMENTS = _FORWARD_ALLVOCABS_TEMPLATE.format( \
+		key="resp_allvocabs_key", types=_ARRAY_TYPES)
 
 	LABEL_KEY_ARGUMENTS = \
 		r"""label_key (str):
@@ -51,14 +118,9 @@ class MetricBase(LoadClassInterface, metaclass=DocStringInheritor):
 		r"""multi_turn_reference_allvocabs_key (str):
 			The key of reference sentences. Default: ``multi_turn_ref_allvocabs``."""
 	FORWARD_MULTI_TURN_REFERENCE_ALLVOCABS_ARGUMENTS = \
-				r"""* **data[multi_turn_reference_allvocabs_key]** (list or :class:`numpy.ndarray`):
-				  A 3-d jagged or padded array of int. Multi-turn reference sentences with
-				  :ref:`all vocabs <vocab_ref>`. Contains start token (eg: ``<go>``) and
-				  end token (eg: ``<eos>``). Size: ``[batch_size, ~turn_length, ~sentence_length]``,
-				  where "~" means different sizes in this dimension is allowed."""
+		_FORWARD_MULTI_TURN_ALLVOCABS_TEMPLATE.format(types=_ARRAY_TYPES)
 	FORWARD_MULTI_TURN_REFERENCE_ALLVOCABS_ARGUMENTS_WITH_TORCH = \
-		FORWARD_MULTI_TURN_REFERENCE_ALLVOCABS_ARGUMENTS.replace("list or :class:`numpy.ndarray`", \
-			"list or :class:`numpy.ndarray` or :class:`torch.Tensor`")
+		_FORWARD_MULTI_TURN_ALLVOCABS_TEMPLATE.format(types=_ARRAY_TYPES_WITH_TORCH)
 
 	REFERENCE_LEN_KEY_ARGUMENTS = \
 		r"""reference_len_key (str):
@@ -115,28 +177,62 @@ class MetricBase(LoadClassInterface, metaclass=DocStringInheritor):
 			the environment variable ``CPU_COUNT`` will be used	when it is set,
 			or all available cpu will be used otherwise."""
 
+	# attributes of subclasses are still stored in __dict__
+	__slots__ = ('_unordered_hash', 'name', 'version', 'closed', '__weakref__')
+
 	def __init__(self, name, version):
-		self.unordered_hash = UnorderedSha256()
+		self._unordered_hash = None
 		self.name = name
 		self.version = version
-		self.unordered_hash.update_data(str(name).encode())
-		self.unordered_hash.update_data(str(version).encode())
 		self.closed = False
 
+	@property
+	def unordered_hash(self):
+		'''(:class:`UnorderedSha256`): The hash of the name, the version and relevant data
+		of the metric. It is created when it is first used.
+		'''
+		if self._unordered_hash is None:
+			self._unordered_hash = UnorderedSha256()
+			self._unordered_hash.update_data(str(self.name).encode())
+			self._unordered_hash.update_data(str(self.version).encode())
+		return self._unordered_hash
+
 	def _hash_relevant_data(self, data_list):
 		'''Invoked by :meth:`.forward` or :meth:`.close` to hash relevant data when computing a metric.
 
 		Arguments:
-			data_list (list): relevant data organized as list.
+			data_list (list): relevant data organized as list. Each item is hashed
+				independently, so the order of items does not matter.
 		'''
+		unordered_hash = self.unordered_hash
+		datas = []
 		for item in data_list:
-			self.unordered_hash.update_data(repr(item).encode())
+			# exact types: bool and subclasses of int or str may have a different repr
+			# pylint: disable=unidiomatic-typecheck
+			if type(item) is int or (type(item) is str and len(item) <= _SMALL_ITEM_MAX_LEN):
+				unordered_hash.update_hash(_small_item_digest(item))
+			elif isinstance(item, (np.ndarray, torch.Tensor)):
+				unordered_hash.update_data_chunks(_canonical_chunks(item))
+			else:
+				datas.append(repr(item).encode())
+		unordered_hash.update_data_many(datas)
 
 	def _hashvalue(self):
 		'''Invoked by :meth:`.close` to return the recorded hash value.
 		'''
 		return self.unordered_hash.digest()
 
+	def _csr_keys(self):
+		'''Invoked by :meth:`MetricChain.add_metric` to get the keys of batches of sentences
+		(2-d jagged or padded arrays of int) read by :meth:`.forward`. If a padded batch is read
+		by more than one metric in a :class:`MetricChain`, it is converted to CSR layout
+		(see :mod:`._kernels`) only once and passed as ``data[key + "__csr"]``.
+
+		Returns:
+			(list): a list of keys in data.
+		'''
+		return []
+
 	def forward(self, data):
 		'''Processing a batch of data.
 
@@ -162,6 +258,26 @@ class MetricBase(LoadClassInterface, metaclass=DocStringInheritor):
 		else:
 			raise RuntimeError("The metric has been closed.")
 
+class _NullUnorderedHash:
+	'''A sink with the interface of :class:`UnorderedSha256` ignoring all data.'''
+	def update_data(self, data):
+		'''ignore data. type(data)=bytes'''
+
+	def update_data_many(self, datas):
+		'''ignore every element of datas. type(datas)=iterable of bytes-like objects'''
+
+	def update_data_chunks(self, chunks):
+		'''ignore chunks. type(chunks)=iterable of bytes-like objects'''
+
+	def update_hash(self, hashvalue):
+		'''ignore hash. type(hashvalue)=bytes'''
+
+	def digest(self):
+		'''return an empty hashvalue'''
+		return ""
+
+_NULL_UNORDERED_HASH = _NullUnorderedHash()
+
 class MetricChain(MetricBase):
 	'''A metric-like class for stacked metric. You can use this class
 	making multiples metric combination like one.
@@ -175,9 +291,16 @@ class MetricChain(MetricBase):
 	'''
 	_name = 'MetricChain'
 	_version = 1
+	__slots__ = ('metric_list', '_forwards', '_csr_key_count', '_shared_csr_keys')
+
 	def __init__(self):
 		super().__init__(self._name, self._version)
 		self.metric_list = []
+		# bound forward methods of the metrics, looked up once in add_metric
+		self._forwards = []
+		# keys of batches passed to children in CSR layout, see MetricBase._csr_keys
+		self._csr_key_count = {}
+		self._shared_csr_keys = []
 
 	def add_metric(self, metric):
 		'''Add metric for processing.
@@ -188,6 +311,35 @@ class MetricChain(MetricBase):
 		if not isinstance(metric, MetricBase):
 			raise TypeError("Metric must be a subclass of MetricBase")
 		self.metric_list.append(metric)
+		self._forwards.append(metric.forward)
+		# pylint: disable=protected-access
+		for key in metric._csr_keys():
+			self._csr_key_count[key] = self._csr_key_count.get(key, 0) + 1
+		self._shared_csr_keys = [key for key, count in self._csr_key_count.items() if count > 1]
+
+	@property
+	def unordered_hash(self):
+		'''A sink ignoring all data, because the results of :class:`MetricChain`
+		only contain the hash values of its components.
+		'''
+		return _NULL_UNORDERED_HASH
+
+	def _csr_keys(self):
+		return list(self._csr_key_count)
+
+	def _add_shared_csr(self, data):
+		'''Return ``data`` with the CSR layout of padded batches read by more than one metric.
+		A copy is returned if any batch is added, so the dict of the caller is not modified.
+		'''
+		shared_keys = [key for key in self._shared_csr_keys if key + _kernels.CSR_KEY_SUFFIX not in data \
+			and isinstance(data.get(key), np.ndarray) and data[key].ndim == 2 \
+			and data[key].size >= _kernels.MIN_PADDED_SIZE]
+		if not shared_keys:
+			return data
+		data = dict(data)
+		for key in shared_keys:
+			data[key + _kernels.CSR_KEY_SUFFIX] = _kernels.flatten_jagged(data[key])
+		return data
 
 	def forward(self, data):
 		'''Processing a batch of data.
@@ -197,8 +349,10 @@ class MetricChain(MetricBase):
 				metric components need.
 		'''
 		super().forward(data)
-		for metric in self.metric_list:
-			metric.forward(data)
+		if self._shared_csr_keys:
+			data = self._add_shared_csr(data)
+		for forward in self._forwards:
+			forward(data)
 
 	def close(self):
 		r'''
@@ -0,0 +1,65 @@
+import hashlib
+import random
+
+import numpy as np
+
+from cotk._utils.unordered_hash import UnorderedSha256
+
+def reference_digest(datas):
+	result = np.zeros(32, dtype=np.uint8)
+	for data in datas:
+		result += np.array(list(hashlib.sha256(data).digest()), dtype=np.uint8)
+	return bytes(result.tolist()).hex()
+
+class TestUnorderedSha256():
+	def test_update_data(self):
+		random.seed(0)
+		datas = [repr(random.random()).encode() for _ in range(UnorderedSha256.BATCH_SIZE * 2 + 7)]
+		unordered_hash = UnorderedSha256()
+		for data in datas:
+			unordered_hash.update_data(data)
+		assert unordered_hash.digest() == reference_digest(datas)
+
+	def test_unordered(self):
+		datas = [str(i).encode() for i in range(1000)]
+		unordered_hash = UnorderedSha256()
+		for data in datas:
+			unordered_hash.update_data(data)
+		random.shuffle(datas)
+		shuffled_hash = UnorderedSha256()
+		for data in datas:
+			shuffled_hash.update_data(data)
+		assert unordered_hash.digest() == shuffled_hash.digest()
+
+	def test_digest_twice(self):
+		unordered_hash = UnorderedSha256()
+		unordered_hash.update_data(b'a')
+		first = unordered_hash.digest()
+		assert unordered_hash.digest() == first
+		unordered_hash.update_data(b'b')
+		assert unordered_hash.digest() == reference_digest([b'a', b'b'])
+
+	def test_update_data_chunks(self):
+		unordered_hash = UnorderedSha256()
+		unordered_hash.update_data_chunks([b'ab', memoryview(b'cd'), bytearray(b'e')])
+		unordered_hash.update_data_chunks([])
+		assert unordered_hash.digest() == reference_digest([b'abcde', b''])
+
+	def test_update_data_many(self):
+		datas = [str(i).encode() for i in range(UnorderedSha256.BATCH_SIZE + 1)]
+		unordered_hash = UnorderedSha256()
+		unordered_hash.update_data_many(datas)
+		unordered_hash.update_data_many(iter([b'a', memoryview(b'b')]))
+		unordered_hash.update_data_many([])
+		assert unordered_hash.digest() == reference_digest(datas + [b'a', b'b'])
+
+	def test_update_data_many_duplicates(self):
+		datas = [b'a'] * 300 + [b'b'] * 256 + [b'c']
+		unordered_hash = UnorderedSha256()
+		unordered_hash.update_data_many(datas)
+		assert unordered_hash.digest() == reference_digest(datas)
+
+	def test_update_data_many_unhashable(self):
+		unordered_hash = UnorderedSha256()
+		unordered_hash.update_data_many([bytearray(b'a'), memoryview(bytearray(b'b'))])
+		assert unordered_hash.digest() == reference_digest([b'a', b'b'])
@@ -0,0 +1,68 @@
+import random
+
+import numpy as np
+import pytest
+
+from cotk.metric import _kernels
+from cotk.metric import BleuCorpusMetric
+from cotk.metric.bleu import _trim_batch
+
+from metric_base import *
+
+def setup_module():
+	random.seed(0)
+	np.random.seed(0)
+
+def random_sentence(dataloader):
+	sent = [random.randint(0, dataloader.vocab_size - 1) for _ in range(random.randint(0, 10))]
+	if random.random() < 0.8:
+		sent.append(dataloader.eos_id)
+	return sent + [dataloader.pad_id] * random.randint(0, 3)
+
+class TestKernels():
+	def test_flatten_jagged(self):
+		flat, offsets = _kernels.flatten_jagged([[1, 2], [], [3]])
+		assert flat.tolist() == [1, 2, 3]
+		assert offsets.tolist() == [0, 2, 2, 3]
+		flat, offsets = _kernels.flatten_jagged(np.array([[1, 2], [3, 4], [5, 6]]))
+		assert flat.tolist() == [1, 2, 3, 4, 5, 6]
+		assert offsets.tolist() == [0, 2, 4, 6]
+
+	@pytest.mark.parametrize('start', [0, 1])
+	def test_trim_batch(self, start):
+		dataloader = FakeDataLoader()
+		for _ in range(100):
+			batch = [random_sentence(dataloader) for _ in range(random.randint(0, 10))]
+			trimmed = [dataloader.trim(sent[start:]) for sent in batch]
+			assert _kernels.trim_batch(batch, dataloader.eos_id, dataloader.pad_id, start) == trimmed
+
+			max_len = max([len(sent) for sent in batch] + [0])
+			padded = np.array([sent + [dataloader.pad_id] * (max_len - len(sent)) for sent in batch], \
+				dtype=int).reshape(len(batch), max_len)
+			trimmed = [dataloader.trim(sent[start:]) for sent in padded]
+			assert _kernels.trim_batch(padded, dataloader.eos_id, dataloader.pad_id, start) == trimmed
+
+	@pytest.mark.parametrize('batch_size', [4, 100])
+	def test_trim_padded_threshold(self, batch_size):
+		dataloader = FakeDataLoader()
+		batch = [random_sentence(dataloader) + [dataloader.pad_id] * 10 for _ in range(batch_size)]
+		padded = np.array([sent[:10] for sent in batch], dtype=int)
+		assert (padded.size >= _kernels.MIN_PADDED_SIZE) == (batch_size == 100)
+		trimmed = [dataloader.trim(sent[1:]) for sent in padded]
+		assert _trim_batch(dataloader, {'gen': padded}, 'gen', 1) == trimmed
+
+	@pytest.mark.parametrize('min_padded_size', [0, 10 ** 9])
+	def test_trim_padded_hash(self, monkeypatch, min_padded_size):
+		dataloader = FakeDataLoader()
+		data = dataloader.get_data(reference_key='ref', gen_key='gen')
+		padded = {key: np.array(data[key]) for key in ['ref', 'gen']}
+		bcm = BleuCorpusMetric(dataloader, reference_allvocabs_key='ref', gen_key='gen')
+		bcm.forward(data)
+		res = bcm.close()
+
+		monkeypatch.setattr(_kernels, 'MIN_PADDED_SIZE', min_padded_size)
+		trimmed = _trim_batch(dataloader, padded, 'ref', 1)
+		assert all(type(word) is int for sent in trimmed for word in sent)
+		bcm = BleuCorpusMetric(dataloader, reference_allvocabs_key='ref', gen_key='gen')
+		bcm.forward(padded)
+		assert bcm.close()['bleu hashvalue'] == res['bleu hashvalue']
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+import torch
+
+from cotk.metric import MetricBase, MetricChain
+from cotk._utils.unordered_hash import UnorderedSha256
+
+def hashvalue(data_list):
+	metric = MetricBase('test', 1)
+	metric._hash_relevant_data(data_list)
+	return metric._hashvalue()
+
+class TestMetricBase():
+	def test_hash_list(self):
+		assert hashvalue([[1, 2, 3], 'a']) == hashvalue(['a', [1, 2, 3]])
+		assert hashvalue([[1, 2, 3]]) != hashvalue([[1, 2, 4]])
+
+	def test_hash_small_items(self):
+		data_list = [1, 1, 'a', 'a' * 100, True, 1.0, b'a', (1,)]
+		unordered_hash = UnorderedSha256()
+		unordered_hash.update_data(b'test')
+		unordered_hash.update_data(b'1')
+		for item in data_list:
+			unordered_hash.update_data(repr(item).encode())
+		assert hashvalue(data_list) == unordered_hash.digest()
+		assert hashvalue([1]) != hashvalue([True])
+
+	def test_hash_int_list(self):
+		data_list = [[-1, 2, 30], list(range(100)), [[1, -2], [3]]]
+		unordered_hash = UnorderedSha256()
+		unordered_hash.update_data(b'test')
+		unordered_hash.update_data(b'1')
+		for item in data_list:
+			unordered_hash.update_data(repr(item).encode())
+		assert hashvalue(data_list) == unordered_hash.digest()
+
+	def test_hash_ndarray(self):
+		data = np.arange(2000, dtype=np.int32)
+		changed = data.copy()
+		changed[1000] = -1
+		assert hashvalue([data]) != hashvalue([changed])
+		assert hashvalue([data]) == hashvalue([data[::-1][::-1].copy()])
+		assert hashvalue([data]) != hashvalue([data.reshape(2, 1000)])
+		assert hashvalue([data]) != hashvalue([data.astype(np.int64)])
+		assert hashvalue([np.zeros((2, 0))]) != hashvalue([np.zeros((0, 2))])
+
+	def test_hash_float(self):
+		data = np.array([0.5, np.nan, 1.0], dtype=np.float32)
+		payload = data.copy()
+		payload.view(np.uint32)[1] = 0xffc00001
+		assert np.isnan(payload[1])
+		assert hashvalue([data]) == hashvalue([payload])
+		assert hashvalue([data]) != hashvalue([np.array([0.5, 0.0, 1.0], dtype=np.float32)])
+		assert hashvalue([np.zeros(2)]) != hashvalue([-np.zeros(2)])
+		assert hashvalue([torch.tensor(data)]) == hashvalue([data])
+
+	def test_hash_tensor(self):
+		data = np.arange(12, dtype=np.int64).reshape(3, 4)
+		assert hashvalue([torch.tensor(data)]) == hashvalue([data])
+		assert hashvalue([torch.tensor(data).t()]) == hashvalue([data.T])
+
+		complex_data = np.array([1 + 1j, 2 - 1j], dtype=np.complex64)
+		assert hashvalue([torch.tensor(complex_data).conj()]) == hashvalue([complex_data.conj()])
+		assert hashvalue([torch.tensor(data)._neg_view()]) == hashvalue([-data])
+		meta = torch.empty(3, device='meta')
+		unordered_hash = UnorderedSha256()
+		unordered_hash.update_data(b'test')
+		unordered_hash.update_data(b'1')
+		unordered_hash.update_data(repr(meta).encode())
+		assert hashvalue([meta]) == unordered_hash.digest()
+
+	def test_lazy_hash(self):
+		metric = MetricBase('test', 1)
+		assert metric._unordered_hash is None
+		assert metric._hashvalue() == hashvalue([])
+
+		chain = MetricChain()
+		chain._hash_relevant_data([1, 'a', [2]])
+		assert chain._hashvalue() == ""
+
+	def test_slots(self):
+		assert not hasattr(MetricChain(), '__dict__')
+		with pytest.raises(AttributeError):
+			MetricChain().unknown_attribute = 1
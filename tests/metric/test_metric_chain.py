@@ -1,10 +1,13 @@
 import copy
+import pickle
 import random
 
 import numpy as np
 import pytest
 
-from cotk.metric import MultiTurnPerplexityMetric, MultiTurnBleuCorpusMetric, MetricChain
+from cotk.metric import MultiTurnPerplexityMetric, MultiTurnBleuCorpusMetric, BleuCorpusMetric, \
+	MetricBase, MetricChain
+from cotk.metric import _kernels
 
 from test_perplexity import TestMultiTurnPerplexityMetric
 from test_bleu import TestMultiTurnBleuCorpusMetric
@@ -14,6 +17,20 @@ def setup_module():
 	random.seed(0)
 	np.random.seed(0)
 
+class BatchCounter(MetricBase):
+	def __init__(self, name):
+		super().__init__(name, 1)
+		self.count = 0
+
+	def forward(self, data):
+		super().forward(data)
+		self.count += 1
+
+	def close(self):
+		res = super().close()
+		res[self.name] = self.count
+		return res
+
 class TestMetricChain():
 	def test_init(self):
 		mc = MetricChain()
@@ -47,3 +64,80 @@ class TestMetricChain():
 		assert np.isclose(res['perplexity'], perplexity)
 		assert np.isclose(res['bleu'], bleu)
 		assert same_dict(data, _data)
+
+	def test_copy(self):
+		dataloader = FakeDataLoader()
+		data = dataloader.get_data(reference_key='reference_key', gen_key='gen_key')
+		_data = copy.deepcopy(data)
+
+		mc = MetricChain()
+		for name in ['a', 'b']:
+			mc.add_metric(BatchCounter(name))
+		mc.add_metric(BleuCorpusMetric(dataloader, reference_allvocabs_key='reference_key', \
+			gen_key='gen_key'))
+		for _ in range(3):
+			mc.forward(data)
+		copy.deepcopy(mc)
+		pickle.dumps(mc)
+		res = mc.close()
+		assert res['a'] == 3 and res['b'] == 3
+		assert 'bleu' in res
+		for metric in mc.metric_list:
+			assert metric.closed
+		assert same_dict(data, _data)
+
+	def test_forward_closed(self):
+		dataloader = FakeDataLoader()
+		data = dataloader.get_data(reference_key='reference_key', gen_key='gen_key')
+		bcm = BleuCorpusMetric(dataloader, reference_allvocabs_key='reference_key', gen_key='gen_key')
+		mc = MetricChain()
+		mc.add_metric(bcm)
+		mc.forward(data)
+		bcm.close()
+		with pytest.raises(ValueError, match="The metric has been closed."):
+			mc.forward(data)
+		with pytest.raises(TypeError, match="Data must be a dict."):
+			MetricChain().forward([])
+
+	def test_shared_csr(self):
+		class KeysRecorder(MetricBase):
+			def __init__(self):
+				super().__init__('KeysRecorder', 1)
+				self.keys = []
+			def _csr_keys(self):
+				return ['gen_key']
+			def forward(self, data):
+				super().forward(data)
+				self.keys.append(sorted(data.keys()))
+
+		data = {'gen_key': np.tile([[4, 5, 3, 0], [6, 7, 8, 3]], (_kernels.MIN_PADDED_SIZE // 8, 1))}
+		small_data = {'gen_key': np.array([[4, 5, 3, 0], [6, 7, 8, 3]])}
+		_data = copy.deepcopy(data)
+		mc = MetricChain()
+		mc.add_metric(KeysRecorder())
+		mc.forward(data)
+		assert mc.metric_list[0].keys == [['gen_key']]
+		mc.add_metric(KeysRecorder())
+		mc.forward(data)
+		mc.forward(small_data)
+		mc.forward({'gen_key': [[4, 5, 3], [6, 7, 8, 3]]})
+		assert mc.metric_list[1].keys == [['gen_key', 'gen_key__csr'], ['gen_key'], ['gen_key']]
+		assert same_dict(data, _data)
+
+	def test_shared_csr_small_batch(self):
+		dataloader = FakeDataLoader()
+		data = dataloader.get_data(reference_key='reference_key', gen_key='gen_key')
+		data = {key: np.array(data[key]) for key in ['reference_key', 'gen_key']}
+		assert data['gen_key'].size < _kernels.MIN_PADDED_SIZE
+		bcm = BleuCorpusMetric(dataloader, reference_allvocabs_key='reference_key', gen_key='gen_key')
+		bcm.forward(data)
+		res_single = bcm.close()
+
+		mc = MetricChain()
+		for _ in range(2):
+			mc.add_metric(BleuCorpusMetric(dataloader, reference_allvocabs_key='reference_key', \
+				gen_key='gen_key'))
+		assert mc._add_shared_csr(data) is data
+		mc.forward(data)
+		for metric in mc.metric_list:
+			assert metric.close() == res_single